@@ -1,9 +1,10 @@
 import streamlit as st
-import requests
+import httpx
 import time
 import os
 import yt_dlp
 import boto3
+from boto3.s3.transfer import TransferConfig
 import uuid
 from dotenv import load_dotenv
 
@@ -21,14 +22,23 @@ R2_SECRET_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
 R2_ENDPOINT = os.getenv("R2_ENDPOINT_URL")
 R2_BUCKET = os.getenv("R2_BUCKET_NAME")
 
+# Multipart upload settings (files under the threshold go up in a single PUT)
+R2_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True
+)
+
 st.set_page_config(
     page_title="AI Voice Dubbing Studio",
     page_icon="🎙️",
     layout="wide"
 )
 
+@st.cache_resource
 def get_r2_client():
-    """Initialize R2 client"""
+    """Initialize R2 client (shared across reruns so its connection pool is reused)"""
     return boto3.client(
         's3',
         endpoint_url=R2_ENDPOINT,
@@ -54,6 +64,10 @@ def download_video_locally(youtube_url, progress_placeholder):
                 "player_client": ["android"]
             }
         },
+        # Larger HTTP chunks/read buffer and parallel DASH/HLS fragments
+        "http_chunk_size": 10 * 1024 * 1024,
+        "buffersize": 1024 * 1024,
+        "concurrent_fragment_downloads": 4,
         "quiet": False,
         "no_warnings": False,
     }
@@ -92,19 +106,19 @@ def upload_to_r2(video_path, job_id, progress_placeholder):
         # Upload file
         object_key = f"temp/{job_id}/video.mp4"
         
-        with open(video_path, 'rb') as f:
-            r2.upload_fileobj(
-                f,
-                R2_BUCKET,
-                object_key,
-                ExtraArgs={
-                    'ContentType': 'video/mp4',
-                    'Metadata': {
-                        'job_id': job_id,
-                        'upload_time': str(int(time.time()))
-                    }
+        r2.upload_file(
+            video_path,
+            R2_BUCKET,
+            object_key,
+            ExtraArgs={
+                'ContentType': 'video/mp4',
+                'Metadata': {
+                    'job_id': job_id,
+                    'upload_time': str(int(time.time()))
                 }
-            )
+            },
+            Config=R2_TRANSFER_CONFIG
+        )
 
         # Generate presigned URL (valid for 24 hours)
         url = r2.generate_presigned_url(
@@ -124,6 +138,12 @@ def main():
     if "client_id" not in st.session_state:
         st.session_state.client_id = str(uuid.uuid4())
 
+    # Keep-alive HTTP/2 client for backend calls, reused across reruns.
+    # Modal answers long-running endpoint calls (>150s) with a 303 to the result, re-issued every ~150s,
+    # so follow redirects with the same 30-hop cap requests had.
+    if "http" not in st.session_state:
+        st.session_state.http = httpx.Client(http2=True, timeout=3600, follow_redirects=True, max_redirects=30)
+
     st.title("🎙️ AI Voice Dubbing Studio")
     st.markdown("""
     **Hybrid Architecture**  
@@ -220,7 +240,7 @@ def main():
             }
 
             start_time = time.time()
-            response = requests.post(BACKEND_URL, json=payload, timeout=3600)
+            response = st.session_state.http.post(BACKEND_URL, json=payload)
 
             if response.status_code == 200:
                 result = response.json()
@@ -251,7 +271,7 @@ def main():
                 status_container.error(f"❌ HTTP Error: {response.status_code}")
                 st.write(response.text)
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             status_container.error("⚠️ Request Timed Out")
         except Exception as e:
             status_container.error(f"❌ Error: {e}")
@@ -1,15 +1,7 @@
 import modal
 import os
 import asyncio
-
-# --------------------------------------------------
-# 🔥 GLOBAL MODEL CACHE
-# --------------------------------------------------
-WHISPER_MODEL = None
-ALIGN_MODEL = None
-ALIGN_METADATA = None
-DIARIZER = None
-XTTS_MODEL = None
+from contextlib import contextmanager
 
 # --------------------------------------------------
 # Image
@@ -41,7 +33,9 @@ dubbing_image = (
         "boto3",
         "fastapi",
         "edge-tts",
-        "scipy"
+        "scipy",
+        "aiohttp",
+        "uvloop"
     )
     .env({"COQUI_TOS_AGREED": "1"})
 )
@@ -63,9 +57,43 @@ BASE_DIR = f"{MOUNT_PATH}/dubbing"
 # --------------------------------------------------
 # HELPERS
 # --------------------------------------------------
+RATE_LOCK_TTL = 10 # seconds before a held lock is considered stale (holder crashed)
+
+@contextmanager
+def rate_limit_lock(client_id):
+    """
+    Per-client mutex backed by rate_limiter: put(skip_if_exists=True) is an atomic
+    acquire and pop() releases. Retries with backoff; breaks locks older than RATE_LOCK_TTL.
+    """
+    import time
+    import random
+
+    lock_key = f"lock:{client_id}"
+    delay = 0.05
+    while not rate_limiter.put(lock_key, time.time(), skip_if_exists=True):
+        acquired_at = rate_limiter.get(lock_key, None)
+        if acquired_at is not None and time.time() - acquired_at > RATE_LOCK_TTL:
+            print(f"Breaking stale rate limit lock for {client_id}")
+            try:
+                rate_limiter.pop(lock_key)
+            except KeyError:
+                pass
+            continue
+        time.sleep(delay + random.uniform(0, delay))
+        delay = min(delay * 2, 1.0)
+    try:
+        yield
+    finally:
+        try:
+            rate_limiter.pop(lock_key)
+        except KeyError:
+            pass
+
 def check_daily_limit(client_id):
     """
     Enforces 3 generations per 24 hours per client_id.
+    Stores a (window_start, count) pair per client; the 24h window starts at first use.
+    The read-modify-write runs under a per-client lock so concurrent requests can't both pass.
     Returns True if allowed, False if blocked.
     """
     import time
@@ -73,23 +101,26 @@ def check_daily_limit(client_id):
         return True # or False to force ID? Let's allow for now or strict?
         # User wants to lock user.
     
-    now = time.time()
-    try:
-        timestamps = rate_limiter.get(client_id, [])
-    except KeyError:
-        timestamps = []
-        
-    # Filter timestamps older than 24h (86400 seconds)
-    valid_timestamps = [t for t in timestamps if now - t < 86400]
+    with rate_limit_lock(client_id):
+        now = time.time()
+        entry = rate_limiter.get(client_id, (now, 0))
+        if isinstance(entry, list):
+            # Old format: list of usage timestamps
+            entry = [t for t in entry if now - t < 86400]
+            entry = (min(entry, default=now), len(entry))
+        window_start, count = entry
+
+        # Window older than 24h (86400 seconds) starts over
+        if now - window_start >= 86400:
+            window_start, count = now, 0
     
-    if len(valid_timestamps) >= 3:
-        print(f"Rate Limit Hit for {client_id}: {len(valid_timestamps)} uses today.")
-        return False
+        if count >= 3:
+            print(f"Rate Limit Hit for {client_id}: {count} uses today.")
+            return False
         
-    valid_timestamps.append(now)
-    rate_limiter[client_id] = valid_timestamps
-    print(f"Rate Limit Check: {client_id} has {len(valid_timestamps)}/3 uses.")
-    return True
+        rate_limiter[client_id] = (window_start, count + 1)
+        print(f"Rate Limit Check: {client_id} has {count + 1}/3 uses.")
+        return True
 
 def detect_gender(audio_path):
     """
@@ -100,10 +131,15 @@ def detect_gender(audio_path):
     import librosa
     import numpy as np
     try:
-        # Load first 30 seconds only for speed
-        y, sr = librosa.load(audio_path, sr=None, duration=30)
-        # Extract Pitch (F0) using probabilistic YIN
-        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=50, fmax=400)
+        # Load first 10 seconds as 8kHz mono only for speed (plenty for a 50-400Hz pitch range)
+        y, sr = librosa.load(audio_path, sr=8000, mono=True, duration=10)
+        # Extract Pitch (F0) using plain YIN (much cheaper than probabilistic YIN)
+        frame_length, hop_length = 1024, 256
+        f0 = librosa.yin(y, fmin=50, fmax=400, sr=sr, frame_length=frame_length, hop_length=hop_length)
+        # YIN has no voicing decision, so ignore near-silent frames
+        rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+        n = min(len(f0), len(rms))
+        f0 = np.where(rms[:n] > 0.1 * rms.max(), f0[:n], np.nan)
         # Calculate mean pitch of voiced segments
         mean_pitch = np.nanmean(f0)
         
@@ -117,239 +153,484 @@ def detect_gender(audio_path):
         print(f"Gender detection error: {e}, defaulting to Male")
         return "Male"
 
+def is_clean_speech(media_path, max_side_ratio=0.05):
+    """
+    Cheap check for speech-only sources (lectures, interviews) that don't need Demucs.
+    media_path may be a local file or an http(s) URL (only the first minute is fetched).
+    Measures side-channel (L-R) energy against mid-channel (L+R) energy on the first
+    60 seconds: background music is mixed wide in stereo, a single voice sits in the center.
+    """
+    import subprocess
+    import numpy as np
+    try:
+        raw = subprocess.run([
+            "ffmpeg", "-v", "error", "-protocol_whitelist", "file,http,https,tcp,tls",
+            "-i", media_path, "-t", "60",
+            "-vn", "-ac", "2", "-ar", "16000", "-f", "f32le", "-"
+        ], check=True, capture_output=True).stdout
+        stereo = np.frombuffer(raw, dtype=np.float32).reshape(-1, 2)
+        mid = stereo.mean(axis=1)
+        side = (stereo[:, 0] - stereo[:, 1]) / 2
+        mid_rms = np.sqrt(np.mean(mid ** 2))
+        side_rms = np.sqrt(np.mean(side ** 2))
+        if mid_rms == 0:
+            return False
+
+        ratio = side_rms / mid_rms
+        print(f"Side/Mid energy ratio: {ratio:.3f}")
+        # Mono / dual-mono sources have no side signal at all, so the ratio says nothing
+        # about background music there: only trust it for real stereo input.
+        if ratio < 1e-3:
+            print("Mono source, running Demucs")
+            return False
+        return ratio < max_side_ratio
+    except Exception as e:
+        print(f"Speech check error: {e}, running Demucs")
+        return False
+
+def download_file(url, out_path, part_size=16 * 1024 * 1024, concurrency=8):
+    """
+    Downloads url to out_path using parallel byte-range GETs.
+    Falls back to a single streamed GET if the server doesn't support ranges.
+    """
+    asyncio.run(download_file_async(url, out_path, part_size, concurrency))
+
+async def download_file_async(url, out_path, part_size, concurrency):
+    import aiohttp
+    from yarl import URL
+
+    read_size = 1024 * 1024
+    # Presigned URLs must be sent byte-for-byte, don't let aiohttp re-quote them
+    url = URL(url, encoded=True)
+
+    # Per-read timeout like requests' timeout=600, no cap on total transfer time
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        # Probe size with a 1-byte range GET (presigned URLs are signed for GET, so HEAD would be rejected)
+        async with session.get(url, headers={"Range": "bytes=0-0"}) as probe:
+            probe.raise_for_status()
+            ranged = probe.status == 206
+            content_range = probe.headers.get("Content-Range", "")
+
+        if not ranged or "/" not in content_range or content_range.endswith("/*"):
+            async with session.get(url) as r:
+                r.raise_for_status()
+                with open(out_path, "wb") as f:
+                    async for chunk in r.content.iter_chunked(read_size):
+                        f.write(chunk)
+            return
+
+        size = int(content_range.rsplit("/", 1)[1])
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        sem = asyncio.Semaphore(concurrency)
+
+        fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+
+            async def fetch(start, end):
+                async with sem, session.get(url, headers={"Range": f"bytes={start}-{end}"}) as r:
+                    r.raise_for_status()
+                    offset = start
+                    async for chunk in r.content.iter_chunked(read_size):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                    if offset != end + 1:
+                        raise IOError(f"Incomplete range {start}-{end}: got {offset - start} bytes")
+
+            tasks = [asyncio.ensure_future(fetch(start, end)) for start, end in ranges]
+            try:
+                await asyncio.gather(*tasks)
+            except:
+                # Stop the remaining parts before the fd is closed underneath them
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            os.close(fd)
+
+def upload_process_output(s3, proc, bucket, key, part_size=16 * 1024 * 1024, max_workers=8):
+    """
+    Streams a subprocess's stdout to S3/R2 as a multipart upload, shipping parts while
+    the process is still producing output. The upload is only completed if the process
+    exits cleanly; otherwise it is aborted and CalledProcessError is raised.
+    """
+    import subprocess
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType="video/mp4")["UploadId"]
+    # Bound buffered parts so a slow uplink doesn't pile the whole file up in memory
+    slots = threading.BoundedSemaphore(max_workers * 2)
+
+    def upload_part(part_number, data):
+        try:
+            resp = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+            return {"PartNumber": part_number, "ETag": resp["ETag"]}
+        finally:
+            slots.release()
+
+    try:
+        futures = []
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            # All parts but the last must be exactly part_size (R2 requirement)
+            while True:
+                data = proc.stdout.read(part_size)
+                if not data:
+                    break
+                slots.acquire()
+                futures.append(ex.submit(upload_part, len(futures) + 1, data))
+            parts = [f.result() for f in futures]
+
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+        if not parts:
+            raise IOError("Process produced no output")
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+    except:
+        proc.kill()
+        proc.wait()
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
 async def generate_edge_tts(text, voice, out_file):
     import edge_tts
     communicate = edge_tts.Communicate(text, voice)
     await communicate.save(out_file)
 
+async def generate_edge_tts_all(jobs, voice, concurrency=16):
+    """
+    Runs Edge TTS for all (text, out_file) jobs concurrently.
+    Returns a list of bools (one per job) indicating success.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(text, out_file):
+        async with sem:
+            try:
+                await generate_edge_tts(text, voice, out_file)
+                return True
+            except Exception as e:
+                print(f"EdgeTTS error: {e}")
+                return False
+
+    return await asyncio.gather(*(one(text, out_file) for text, out_file in jobs))
+
 # --------------------------------------------------
 # MAIN GPU PIPELINE
 # --------------------------------------------------
-@app.function(
-    gpu="A10",
-    volumes={MOUNT_PATH: volume},
-    secrets=[hf_token, r2_secret],
-    timeout=3600
-)
-@modal.fastapi_endpoint(method="POST")
-def dub_video(item: dict):
-    # -------------------- RUNTIME CONFIG --------------------
+# Source languages whose alignment models are loaded at container start
+# (anything else is loaded on first use and kept for the container's lifetime)
+PRELOAD_ALIGN_LANGS = ["en", "hi"]
+
+def configure_model_cache():
     os.environ["HF_HOME"] = f"{MOUNT_PATH}/models/hf"
     os.environ["TORCH_HOME"] = f"{MOUNT_PATH}/models/torch"
     os.environ["TTS_HOME"] = f"{MOUNT_PATH}/models/tts"
     os.environ["XDG_CACHE_HOME"] = f"{MOUNT_PATH}/cache"
     os.environ["COQUI_TOS_AGREED"] = "1"
 
-    # Runtime imports to ensure availability
-    import subprocess
-    import ffmpeg
-    import soundfile as sf
-    import whisperx
-    from TTS.api import TTS
-    from deep_translator import GoogleTranslator
-    from botocore.config import Config
-    import librosa
-    import edge_tts
-    import asyncio
-    import torch
-    import numpy as np
-    import shutil
-    import re
-
-    global WHISPER_MODEL, ALIGN_MODEL, ALIGN_METADATA, DIARIZER, XTTS_MODEL
-
-    job_id = item["job_id"]
-    video_url = item["video_url"]
-    target_lang = item.get("target_lang", "hi")
-    client_id = item.get("client_id", "unknown_user")
-    
-    # ------------------ SECURITY CHECKS ------------------
-    import re
-    # 1. Path Traversal Prevention
-    # Allow alphanumeric, underscore, hyphen only. No illegal chars.
-    if not re.match(r"^[a-zA-Z0-9_-]+$", job_id):
-        print(f"[{job_id}] SECURITY BLOCK: Invalid job_id format.")
-        return {"status": "error", "message": "Invalid job_id format. Security Block."}
-        
-    # 2. SSRF Prevention (Basic)
-    # Ensure scheme is http or https.
-    if not video_url.startswith(("http://", "https://")):
-        print(f"[{job_id}] SECURITY BLOCK: Invalid URL scheme.")
-        return {"status": "error", "message": "Invalid URL scheme."}
-    # -----------------------------------------------------
-    
-    print(f"[{job_id}] Starting V3 Pipeline (EdgeTTS + GenderDetect)... User: {client_id}")
-
-    # Rate Limit Check
-    if not check_daily_limit(client_id):
-        print(f"[{job_id}] BLOCKED by Rate Limit.")
-        return {"status": "error", "message": "Daily limit reached (3/3). Please try again in 24 hours."}
-
-    # Setup directories
-    job_dir = f"{BASE_DIR}/{job_id}"
-    os.makedirs(job_dir, exist_ok=True)
-
-    video_path = f"{job_dir}/video.mp4"
-    audio_path = f"{job_dir}/audio.wav"
-    dubbed_audio = f"{job_dir}/dubbed.wav"
-    final_video = f"{job_dir}/final_dubbed.mp4"
-
-    # 1. DOWNLOAD VIDEO
-    print(f"[{job_id}] Downloading video...")
-    import requests
-    r = requests.get(video_url, stream=True, timeout=600)
-    r.raise_for_status()
-    with open(video_path, "wb") as f:
-        for chunk in r.iter_content(8192):
-            f.write(chunk)
-
-    # 2. EXTRACT AUDIO
-    print(f"[{job_id}] Extracting audio...")
-    subprocess.run([
-        "ffmpeg", "-y", "-i", video_path,
-        "-vn", "-acodec", "pcm_s16le",
-        "-ar", "44100", "-ac", "2",
-        audio_path
-    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    # 3. DEMUCS
-    print(f"[{job_id}] Separating vocals...")
-    demucs_out = f"{job_dir}/separated"
-    subprocess.run([
-        "demucs", "--two-stems=vocals", "-n", "htdemucs", "--segment", "7",
-        "-o", demucs_out, audio_path
-    ], check=True)
-
-    vocals, bg = None, None
-    for root, _, files in os.walk(demucs_out):
-        if "vocals.wav" in files:
-            vocals = os.path.join(root, "vocals.wav")
-            bg = os.path.join(root, "no_vocals.wav")
-            break
-
-    if not vocals:
-        shutil.rmtree(job_dir, ignore_errors=True)
-        return {"status": "error", "message": "Demucs failed"}
+@app.cls(
+    gpu="A10",
+    volumes={MOUNT_PATH: volume},
+    secrets=[hf_token, r2_secret],
+    timeout=3600
+)
+class DubbingPipeline:
+    @modal.enter()
+    def load(self):
+        """Loads all models once per container so warm requests skip model load."""
+        configure_model_cache()
+        import whisperx
+        from TTS.api import TTS
 
-    # 4. WHISPERX
-    print(f"[{job_id}] Transcribing...")
-    if WHISPER_MODEL is None:
         print("Loading WhisperX model...")
-        WHISPER_MODEL = whisperx.load_model("medium", device="cuda", compute_type="float16")
+        self.whisper = whisperx.load_model("medium", device="cuda", compute_type="int8_float16",
+                                           asr_options={"beam_size": 1})
+
+        self.align_models = {}
+        for lang in PRELOAD_ALIGN_LANGS:
+            self.get_align_model(lang)
+
+        print("Loading Diarization pipeline...")
+        self.diarizer = whisperx.DiarizationPipeline(use_auth_token=os.environ["HF_TOKEN"], device="cuda")
+
+        print("Loading XTTS model...")
+        self.xtts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cuda")
+
+    def get_align_model(self, lang):
+        """Returns (model, metadata) for lang, loading and caching it on first use."""
+        if lang not in self.align_models:
+            import whisperx
+            print(f"Loading alignment model for {lang}...")
+            self.align_models[lang] = whisperx.load_align_model(lang, device="cuda")
+        return self.align_models[lang]
+
+    @modal.fastapi_endpoint(method="POST")
+    def dub_video(self, item: dict):
+        # -------------------- RUNTIME CONFIG --------------------
+        configure_model_cache()
+
+        # Runtime imports to ensure availability
+        import subprocess
+        import ffmpeg
+        import soundfile as sf
+        import whisperx
+        from deep_translator import GoogleTranslator
+        from botocore.config import Config
+        import librosa
+        import edge_tts
+        import asyncio
+        import uvloop
+        import torch
+        import numpy as np
+        import shutil
+        import re
+        from concurrent.futures import ThreadPoolExecutor
+
+        job_id = item["job_id"]
+        video_url = item["video_url"]
+        target_lang = item.get("target_lang", "hi")
+        client_id = item.get("client_id", "unknown_user")
     
-    audio_wav = whisperx.load_audio(vocals)
-    result = WHISPER_MODEL.transcribe(audio_wav, batch_size=8, chunk_size=30)
-    lang = result["language"]
-    print(f"[{job_id}] Detected language: {lang}")
-
-    if ALIGN_MODEL is None:
-        ALIGN_MODEL, ALIGN_METADATA = whisperx.load_align_model(lang, device="cuda")
-    result = whisperx.align(result["segments"], ALIGN_MODEL, ALIGN_METADATA, audio_wav, device="cuda")
-
-    if DIARIZER is None:
-        DIARIZER = whisperx.DiarizationPipeline(use_auth_token=os.environ["HF_TOKEN"], device="cuda")
-    diar = DIARIZER(audio_wav)
-    result = whisperx.assign_word_speakers(diar, result)
-
-    # 5. TRANSLATION
-    print(f"[{job_id}] Translating to {target_lang}...")
-    translator = GoogleTranslator(source="auto", target=target_lang)
-    for seg in result["segments"]:
-        try:
-            seg["translated_text"] = translator.translate(seg["text"])
-        except:
-            seg["translated_text"] = seg["text"]
-
-    # 6. SYNTHESIS (XTTS vs EDGE TTS)
-    xtts_langs = ["en","es","fr","de","it","pt","pl","tr","ru","nl","cs","ar","zh","ja","ko","hi"]
-    combined = []
-
-    if target_lang in xtts_langs:
-        # XTTS CLONING
-        print(f"[{job_id}] Using XTTS (Cloning) for {target_lang}")
-        if XTTS_MODEL is None:
-            print("Loading XTTS model...")
-            XTTS_MODEL = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cuda")
+        # ------------------ SECURITY CHECKS ------------------
+        import re
+        # 1. Path Traversal Prevention
+        # Allow alphanumeric, underscore, hyphen only. No illegal chars.
+        if not re.match(r"^[a-zA-Z0-9_-]+$", job_id):
+            print(f"[{job_id}] SECURITY BLOCK: Invalid job_id format.")
+            return {"status": "error", "message": "Invalid job_id format. Security Block."}
         
-        for seg in result["segments"]:
-            if not seg.get("translated_text"): continue
+        # 2. SSRF Prevention (Basic)
+        # Ensure scheme is http or https.
+        if not video_url.startswith(("http://", "https://")):
+            print(f"[{job_id}] SECURITY BLOCK: Invalid URL scheme.")
+            return {"status": "error", "message": "Invalid URL scheme."}
+        # -----------------------------------------------------
+    
+        print(f"[{job_id}] Starting V3 Pipeline (EdgeTTS + GenderDetect)... User: {client_id}")
+
+        # Rate Limit Check
+        if not check_daily_limit(client_id):
+            print(f"[{job_id}] BLOCKED by Rate Limit.")
+            return {"status": "error", "message": "Daily limit reached (3/3). Please try again in 24 hours."}
+
+        # Setup directories
+        job_dir = f"{BASE_DIR}/{job_id}"
+        os.makedirs(job_dir, exist_ok=True)
+        # Scratch files that never need to persist live on the container's local disk, not the volume
+        tmp_dir = f"/tmp/{job_id}"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        video_path = f"{job_dir}/video.mp4"
+        dubbed_audio = f"{job_dir}/dubbed.wav"
+
+        # 1. DOWNLOAD VIDEO
+        # The speech check only needs the first minute of audio, so it probes the URL
+        # (ffmpeg range requests) while the full download runs.
+        print(f"[{job_id}] Downloading video...")
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            clean_speech = ex.submit(is_clean_speech, video_url)
+            download_file(video_url, video_path)
+            clean_speech = clean_speech.result()
+
+        # 2+3. DEMUCS
+        if clean_speech:
+            # Nothing to separate: use the mono mix as vocals and skip the background bed
+            print(f"[{job_id}] Clean speech detected, skipping Demucs...")
+            vocals, bg = f"{job_dir}/vocals.wav", None
+            subprocess.run([
+                "ffmpeg", "-y", "-i", video_path,
+                "-vn", "-acodec", "pcm_s16le",
+                "-ar", "44100", "-ac", "1",
+                vocals
+            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            # Demucs decodes the mp4's audio track itself (ffmpeg piped into memory),
+            # so no intermediate WAV is written to the volume.
+            print(f"[{job_id}] Separating vocals...")
+            demucs_out = f"{job_dir}/separated"
+            subprocess.run([
+                "demucs", "--two-stems=vocals", "-n", "htdemucs", "--segment", "7", "--overlap", "0.1",
+                "-o", demucs_out, video_path
+            ], check=True)
+
+            vocals, bg = None, None
+            for root, _, files in os.walk(demucs_out):
+                if "vocals.wav" in files:
+                    vocals = os.path.join(root, "vocals.wav")
+                    bg = os.path.join(root, "no_vocals.wav")
+                    break
+
+            if not vocals:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return {"status": "error", "message": "Demucs failed"}
+
+        # 4. WHISPERX
+        print(f"[{job_id}] Transcribing...")
+        audio_wav = whisperx.load_audio(vocals)
+
+        def diarize():
+            # Own CUDA stream so pyannote kernels don't serialize behind transcription/alignment
+            with torch.cuda.stream(torch.cuda.Stream()):
+                diar = self.diarizer(audio_wav)
+            torch.cuda.synchronize()
+            return diar
+
+        # Diarization runs in the background while Whisper transcribes and aligns
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            diar_future = ex.submit(diarize)
+
+            result = self.whisper.transcribe(audio_wav, batch_size=32, chunk_size=30)
+            lang = result["language"]
+            print(f"[{job_id}] Detected language: {lang}")
+
+            align_model, align_metadata = self.get_align_model(lang)
+            result = whisperx.align(result["segments"], align_model, align_metadata, audio_wav, device="cuda")
+
+            diar = diar_future.result()
+        result = whisperx.assign_word_speakers(diar, result)
+
+        # 5. TRANSLATION
+        print(f"[{job_id}] Translating to {target_lang}...")
+        def translate(text):
+            # GoogleTranslator keeps per-request state on the instance, so use one per call
             try:
-                wav = XTTS_MODEL.tts(text=seg["translated_text"], speaker_wav=vocals, language=target_lang)
-                combined.extend(wav)
-            except Exception as e:
-                print(f"XTTS error: {e}")
+                return GoogleTranslator(source="auto", target=target_lang).translate(text)
+            except:
+                return text
+
+        with ThreadPoolExecutor(max_workers=16) as ex:
+            translated = list(ex.map(translate, [seg["text"] for seg in result["segments"]]))
+        for seg, text in zip(result["segments"], translated):
+            seg["translated_text"] = text
+
+        # 6. SYNTHESIS (XTTS vs EDGE TTS)
+        xtts_langs = ["en","es","fr","de","it","pt","pl","tr","ru","nl","cs","ar","zh","ja","ko","hi"]
+        chunks = []  # float32 arrays, one per synthesized segment
+
+        if target_lang in xtts_langs:
+            # XTTS CLONING
+            print(f"[{job_id}] Using XTTS (Cloning) for {target_lang}")
+            xtts_model = self.xtts.synthesizer.tts_model
+            # Encode the reference speaker once instead of on every segment
+            # Same conditioning/sampling settings TTS.tts() takes from the model config
+            cfg = xtts_model.config
+            gpt_cond_latent, speaker_embedding = xtts_model.get_conditioning_latents(
+                audio_path=[vocals], gpt_cond_len=cfg.gpt_cond_len, gpt_cond_chunk_len=cfg.gpt_cond_chunk_len,
+                max_ref_length=cfg.max_ref_len, sound_norm_refs=cfg.sound_norm_refs)
+
+            # 10000 samples (~0.42s) of silence after each sentence, as Synthesizer.tts() adds
+            sentence_gap = np.zeros(10000, dtype=np.float32)
+
+            with torch.inference_mode():
+                for seg in result["segments"]:
+                    if not seg.get("translated_text"): continue
+                    try:
+                        # Split like TTS.tts() does; XTTS's own splitter has no char limit for some languages (e.g. hi)
+                        seg_chunks = []
+                        for sentence in self.xtts.synthesizer.split_into_sentences(seg["translated_text"]):
+                            out = xtts_model.inference(sentence, target_lang, gpt_cond_latent, speaker_embedding,
+                                                       temperature=cfg.temperature, length_penalty=cfg.length_penalty,
+                                                       repetition_penalty=cfg.repetition_penalty, top_k=cfg.top_k,
+                                                       top_p=cfg.top_p, enable_text_splitting=False)
+                            seg_chunks += [np.asarray(out["wav"], dtype=np.float32), sentence_gap]
+                        chunks.extend(seg_chunks)
+                    except Exception as e:
+                        print(f"XTTS error: {e}")
+
+        else:
+            # EDGE TTS (High Quality Fallback)
+            print(f"[{job_id}] Using Microsoft Edge TTS for {target_lang}")
         
-        sf.write(dubbed_audio, combined, 24000)
-
-    else:
-        # EDGE TTS (High Quality Fallback)
-        print(f"[{job_id}] Using Microsoft Edge TTS for {target_lang}")
+            # Detect Gender
+            gender = detect_gender(vocals)
+            print(f"[{job_id}] Selected Voice Gender: {gender}")
+
+            # Edge TTS Voice Mapping
+            edge_voices = {
+                "kn": {"Male": "kn-IN-GaganNeural", "Female": "kn-IN-SapnaNeural"},
+                "te": {"Male": "te-IN-MohanNeural", "Female": "te-IN-ShrutiNeural"},
+                "ta": {"Male": "ta-IN-ValluvarNeural", "Female": "ta-IN-PallaviNeural"},
+                "ml": {"Male": "ml-IN-MidhunNeural", "Female": "ml-IN-SobhanaNeural"},
+                "mr": {"Male": "mr-IN-ManoharNeural", "Female": "mr-IN-AarohiNeural"},
+                "gu": {"Male": "gu-IN-NiranjanNeural", "Female": "gu-IN-DhwaniNeural"},
+                "bn": {"Male": "bn-BD-PradeepNeural", "Female": "bn-BD-NabanitaNeural"}, # Or IN variants
+                "ur": {"Male": "ur-PK-UzairNeural", "Female": "ur-PK-UzmaNeural"}
+            }
         
-        # Detect Gender
-        gender = detect_gender(vocals)
-        print(f"[{job_id}] Selected Voice Gender: {gender}")
-
-        # Edge TTS Voice Mapping
-        edge_voices = {
-            "kn": {"Male": "kn-IN-GaganNeural", "Female": "kn-IN-SapnaNeural"},
-            "te": {"Male": "te-IN-MohanNeural", "Female": "te-IN-ShrutiNeural"},
-            "ta": {"Male": "ta-IN-ValluvarNeural", "Female": "ta-IN-PallaviNeural"},
-            "ml": {"Male": "ml-IN-MidhunNeural", "Female": "ml-IN-SobhanaNeural"},
-            "mr": {"Male": "mr-IN-ManoharNeural", "Female": "mr-IN-AarohiNeural"},
-            "gu": {"Male": "gu-IN-NiranjanNeural", "Female": "gu-IN-DhwaniNeural"},
-            "bn": {"Male": "bn-BD-PradeepNeural", "Female": "bn-BD-NabanitaNeural"}, # Or IN variants
-            "ur": {"Male": "ur-PK-UzairNeural", "Female": "ur-PK-UzmaNeural"}
-        }
-        
-        # Default to English if unknown, but hopefully logic covers it
-        lang_voices = edge_voices.get(target_lang, {"Male": "en-US-ChristopherNeural", "Female": "en-US-JennyNeural"})
-        selected_voice = lang_voices.get(gender, lang_voices["Male"])
-        print(f"[{job_id}] Voice: {selected_voice}")
+            # Default to English if unknown, but hopefully logic covers it
+            lang_voices = edge_voices.get(target_lang, {"Male": "en-US-ChristopherNeural", "Female": "en-US-JennyNeural"})
+            selected_voice = lang_voices.get(gender, lang_voices["Male"])
+            print(f"[{job_id}] Voice: {selected_voice}")
+
+            # Run all Edge TTS requests on one (uvloop) event loop
+            tts_jobs = [(seg["translated_text"], f"{tmp_dir}/seg_{i}.mp3")
+                        for i, seg in enumerate(result["segments"]) if seg.get("translated_text")]
+            ok = uvloop.run(generate_edge_tts_all(tts_jobs, selected_voice))
+            temp_files = [out_file for (_, out_file), success in zip(tts_jobs, ok) if success]
+
+            def load_segment(temp_seg_file):
+                try:
+                    # Read back with Librosa (resample to 24000 to match XTTS baseline logic for mixing)
+                    seg_wav, _ = librosa.load(temp_seg_file, sr=24000, dtype=np.float32)
+                    return seg_wav
+                except Exception as e:
+                    print(f"EdgeTTS error: {e}")
+                    return None
+
+            # Decode in parallel, map() keeps segment order
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                for seg_wav in ex.map(load_segment, temp_files):
+                    if seg_wav is not None:
+                        chunks.append(seg_wav)
+
+        if not chunks:
+            print(f"[{job_id}] No speech was synthesized.")
+            shutil.rmtree(job_dir, ignore_errors=True)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return {"status": "error", "message": "Speech synthesis failed"}
+
+        # Single C-level copy instead of growing a Python list sample by sample
+        dubbed = np.concatenate(chunks)
+        sf.write(dubbed_audio, dubbed, 24000, subtype="PCM_16")
+
+        # 7+8. MIXING & UPLOAD
+        # ffmpeg writes fragmented MP4 to stdout, which is uploaded part by part as it's muxed
+        print(f"[{job_id}] Mixing and uploading...")
+        import boto3
+        r2 = boto3.client("s3", endpoint_url=os.environ["R2_ENDPOINT_URL"],
+                          aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
+                          aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
+                          region_name="auto", config=Config(signature_version="s3v4"))
+        key = f"dubbed/{job_id}.mp4"
 
-        for i, seg in enumerate(result["segments"]):
-            if not seg.get("translated_text"): continue
-            try:
-                temp_seg_file = f"{job_dir}/temp_{i}.mp3"
-                # Run Async Edge TTS
-                asyncio.run(generate_edge_tts(seg["translated_text"], selected_voice, temp_seg_file))
-                
-                # Read back with Librosa (resample to 24000 to match XTTS baseline logic for mixing)
-                seg_wav, _ = librosa.load(temp_seg_file, sr=24000)
-                combined.extend(seg_wav)
-                
-                # Cleanup
-                if os.path.exists(temp_seg_file):
-                    os.remove(temp_seg_file)
-            except Exception as e:
-                print(f"EdgeTTS error: {e}")
-
-        sf.write(dubbed_audio, combined, 24000)
-
-    # 7. MIXING
-    print(f"[{job_id}] Mixing...")
-    try:
-        v_stream = ffmpeg.input(video_path).video
-        a_stream = ffmpeg.input(dubbed_audio)
-        bg_stream = ffmpeg.input(bg).filter("volume", 0.5) # Background music volume
-        mixed = ffmpeg.filter([a_stream, bg_stream], "amix", inputs=2, duration="first")
-        ffmpeg.output(v_stream, mixed, final_video, vcodec="copy", acodec="aac").run(overwrite_output=True)
-    except ffmpeg.Error as e:
-        print(f"FFmpeg Error: {e.stderr.decode() if e.stderr else str(e)}")
-        shutil.rmtree(job_dir, ignore_errors=True)
-        return {"status": "error", "message": "Mixing failed"}
-
-    # 8. UPLOAD
-    print(f"[{job_id}] Uploading...")
-    import boto3
-    r2 = boto3.client("s3", endpoint_url=os.environ["R2_ENDPOINT_URL"],
-                      aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
-                      aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
-                      region_name="auto", config=Config(signature_version="s3v4"))
-    
-    key = f"dubbed/{job_id}.mp4"
-    r2.upload_file(final_video, os.environ["R2_BUCKET_NAME"], key)
-    url = r2.generate_presigned_url("get_object", Params={"Bucket": os.environ["R2_BUCKET_NAME"], "Key": key}, ExpiresIn=3600)
+        try:
+            v_stream = ffmpeg.input(video_path).video
+            a_stream = ffmpeg.input(dubbed_audio)
+            if bg:
+                bg_stream = ffmpeg.input(bg).filter("volume", 0.5) # Background music volume
+                mixed = ffmpeg.filter([a_stream, bg_stream], "amix", inputs=2, duration="first")
+            else:
+                mixed = a_stream
+            proc = (
+                ffmpeg.output(v_stream, mixed, "pipe:", format="mp4", vcodec="copy", acodec="aac", audio_bitrate="96k",
+                              movflags="+frag_keyframe+empty_moov", threads=0)
+                .global_args("-filter_complex_threads", str(os.cpu_count() or 1))
+                .run_async(pipe_stdout=True)
+            )
+            upload_process_output(r2, proc, os.environ["R2_BUCKET_NAME"], key)
+        except Exception as e:
+            print(f"Mix/Upload Error: {e}")
+            shutil.rmtree(job_dir, ignore_errors=True)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return {"status": "error", "message": "Mixing failed"}
+
+        url = r2.generate_presigned_url("get_object", Params={"Bucket": os.environ["R2_BUCKET_NAME"], "Key": key}, ExpiresIn=3600)
     
-    print(f"[{job_id}] Done! URL: {url}")
-    shutil.rmtree(job_dir, ignore_errors=True)
-    return {"status": "success", "video_url": url}
+        print(f"[{job_id}] Done! URL: {url}")
+        shutil.rmtree(job_dir, ignore_errors=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return {"status": "success", "video_url": url}